@@ -1,55 +1,22 @@
-from .dataset import SplitDataset, ZippedDataset
+import os
 
+from .dataset import TEMPORARY_DIR, SplitDataset, ZippedDataset
 
-class EMNIST(SplitDataset):
-    """
-    EMNIST Dataset
-    https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
+# zip archive with files of all splits, downloaded by `EMNIST`
+_ZIP_FILENAME = "gzip.zip"
+_ZIP_MD5 = "58c8d27c78d21e728a6bc7b3cc06412e"
 
-    Attributes
-    ----------
-    target_dir : str
-        Directory where all files exist or will be downloaded.
-    Balanced, ByClass, ByMerge, Digits, Letters : class
-        Child classes containing splits of EMNIST dataset.
 
-    Usage
-    -----
-    >>> from mnists import EMNIST
-    >>> emnist = EMNIST()
-    >>> letters = emnist.Letters()
-    >>> letters.train_images().dtype
-    dtype('uint8')
+class _EMNISTSplit(ZippedDataset):
+    # defaults of splits created directly, not through `EMNIST` object
+    __slots__ = ()
 
-    Citation
-    --------
-    @article{cohen2017emnist,
-      title={EMNIST: an extension of MNIST to handwritten letters},
-      author={Gregory Cohen and Saeed Afshar and Jonathan Tapson and André van Schaik},
-      year={2017},
-      eprint={1702.05373},
-      archivePrefix={arXiv},
-      primaryClass={cs.CV}
-    }
-    """
-
-    mirrors = [
-        "https://biometrics.nist.gov/cs_links/EMNIST/",
-    ]
+    default_base_dir = os.path.join(TEMPORARY_DIR, "EMNIST")
+    default_zip_filepath = os.path.join(default_base_dir, _ZIP_FILENAME)
+    default_zip_md5 = _ZIP_MD5
 
-    resources = {"gzip": ("gzip.zip", "58c8d27c78d21e728a6bc7b3cc06412e")}
 
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
-
-        self.Balanced = self._create_split(Balanced)
-        self.ByClass = self._create_split(ByClass)
-        self.ByMerge = self._create_split(ByMerge)
-        self.Digits = self._create_split(Digits)
-        self.Letters = self._create_split(Letters)
-
-
-class Balanced(ZippedDataset):
+class Balanced(_EMNISTSplit):
     """
     EMNIST Balanced
     https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
@@ -83,6 +50,8 @@ class Balanced(ZippedDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "0",
         "1",
@@ -153,7 +122,7 @@ class Balanced(ZippedDataset):
     }
 
 
-class ByClass(ZippedDataset):
+class ByClass(_EMNISTSplit):
     """
     EMNIST ByClass
     https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
@@ -187,6 +156,8 @@ class ByClass(ZippedDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "0",
         "1",
@@ -272,7 +243,7 @@ class ByClass(ZippedDataset):
     }
 
 
-class ByMerge(ZippedDataset):
+class ByMerge(_EMNISTSplit):
     """
     EMNIST ByMerge
     https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
@@ -306,6 +277,8 @@ class ByMerge(ZippedDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = Balanced.classes
 
     resources = {
@@ -328,7 +301,7 @@ class ByMerge(ZippedDataset):
     }
 
 
-class Digits(ZippedDataset):
+class Digits(_EMNISTSplit):
     """
     EMNIST Digits
     https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
@@ -362,6 +335,8 @@ class Digits(ZippedDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "0",
         "1",
@@ -395,7 +370,7 @@ class Digits(ZippedDataset):
     }
 
 
-class Letters(ZippedDataset):
+class Letters(_EMNISTSplit):
     """
     EMNIST Letters
     https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
@@ -429,6 +404,8 @@ class Letters(ZippedDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "a",
         "b",
@@ -482,3 +459,55 @@ class Letters(ZippedDataset):
 
     def test_labels(self):
         return super().test_labels() - 1
+
+
+class EMNIST(SplitDataset):
+    """
+    EMNIST Dataset
+    https://www.westernsydney.edu.au/bens/home/reproducible_research/emnist
+
+    Attributes
+    ----------
+    target_dir : str
+        Directory where all files exist or will be downloaded.
+    Balanced, ByClass, ByMerge, Digits, Letters : callable
+        Constructors of splits of EMNIST dataset, unzipped to subdirectories
+        of `target_dir`.
+    splits : dict[str, type]
+        Dictionary of classes of EMNIST splits.
+
+    Usage
+    -----
+    >>> from mnists import EMNIST
+    >>> emnist = EMNIST()
+    >>> letters = emnist.Letters()
+    >>> letters.train_images().dtype
+    dtype('uint8')
+
+    Citation
+    --------
+    @article{cohen2017emnist,
+      title={EMNIST: an extension of MNIST to handwritten letters},
+      author={Gregory Cohen and Saeed Afshar and Jonathan Tapson and André van Schaik},
+      year={2017},
+      eprint={1702.05373},
+      archivePrefix={arXiv},
+      primaryClass={cs.CV}
+    }
+    """
+
+    __slots__ = ()
+
+    mirrors = [
+        "https://biometrics.nist.gov/cs_links/EMNIST/",
+    ]
+
+    resources = {"gzip": (_ZIP_FILENAME, _ZIP_MD5)}
+
+    splits = {
+        "Balanced": Balanced,
+        "ByClass": ByClass,
+        "ByMerge": ByMerge,
+        "Digits": Digits,
+        "Letters": Letters,
+    }
@@ -52,6 +52,8 @@ class MNIST(IdxDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "0 - zero",
         "1 - one",
@@ -128,6 +130,8 @@ class FashionMNIST(IdxDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "T-shirt/top",
         "Trouser",
@@ -202,6 +206,8 @@ class KMNIST(IdxDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "お - o",
         "き - ki",
@@ -276,6 +282,8 @@ class K49(NpzDataset):
     }
     """
 
+    __slots__ = ()
+
     classes = [
         "あ - a",
         "い - i",
@@ -1,15 +1,35 @@
+import functools
+import io
 import os
 import tempfile
-from typing import Optional
+import threading
+import weakref
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
 
 import numpy as np
 
-from .utils import check_file_integrity, download_file, extract_from_zip, read_idx_file
+from .utils import (
+    check_file_integrity,
+    check_files_integrity,
+    download_files,
+    extract_from_zip,
+    is_cache_fresh,
+    rank_mirrors,
+    read_idx_from_bytes,
+    read_verified_file,
+    save_npy_file,
+    scale_images,
+    transpose_images,
+)
 
 TEMPORARY_DIR = os.path.join(tempfile.gettempdir(), "mnists")
 
 
 class Dataset:
+    __slots__ = ("target_dir",)
+
     mirrors = []
     resources = {}
 
@@ -34,14 +54,40 @@ class Dataset:
         """
 
         self.target_dir = (
-            os.path.join(TEMPORARY_DIR, type(self).__name__)
-            if target_dir is None
-            else target_dir
+            self._default_target_dir() if target_dir is None else target_dir
         )
 
         if download or force_download:
             self.download(force_download, verbose)
 
+    @classmethod
+    def is_cached(cls, target_dir: Optional[str] = None) -> bool:
+        """
+        Check if all files of the dataset exist and have valid checksums.
+
+        Parameters
+        ----------
+        target_dir : str, default='/tmp/<dataset_name>/'
+            Directory where the files are looked for.
+
+        Returns
+        -------
+        bool
+            True if the dataset doesn't need to be downloaded.
+        """
+
+        if target_dir is None:
+            target_dir = cls._default_target_dir()
+
+        return all(
+            check_file_integrity(os.path.join(target_dir, filename), md5)
+            for filename, md5 in cls.resources.values()
+        )
+
+    @classmethod
+    def _default_target_dir(cls) -> str:
+        return os.path.join(TEMPORARY_DIR, cls.__name__)
+
     def download(self, force: bool = False, verbose: bool = True) -> None:
         """
         Download files from mirrors and save to `target_dir`.
@@ -56,16 +102,50 @@ class Dataset:
 
         os.makedirs(self.target_dir, exist_ok=True)
 
-        for filename, md5 in self.resources.values():
-            filepath = os.path.join(self.target_dir, filename)
-
-            if not force and check_file_integrity(filepath, md5):
-                continue
+        files = {
+            os.path.join(self.target_dir, filename): (filename, md5)
+            for filename, md5 in self.resources.values()
+        }
+        if force:
+            is_valid = dict.fromkeys(files, False)
+        else:
+            is_valid = check_files_integrity(
+                {filepath: md5 for filepath, (_, md5) in files.items()}
+            )
 
-            download_file(self.mirrors, filename, filepath, verbose)
+        missing = [
+            (filename, filepath, md5)
+            for filepath, (filename, md5) in files.items()
+            if not is_valid[filepath]
+        ]
+        if not missing:
+            return
+
+        # mirrors are ranked once, all files are downloaded from the same one
+        mirrors = rank_mirrors(self.mirrors, missing[0][0])
+        download_files(
+            [(mirrors, filename, filepath, md5) for filename, filepath, md5 in missing],
+            verbose,
+        )
 
 
 class IdxDataset(Dataset):
+    __slots__ = (
+        "_train_images",
+        "_train_labels",
+        "_test_images",
+        "_test_labels",
+        "use_npy_cache",
+    )
+
+    # if True, loaded arrays are cached in `.npy` files next to the data files
+    default_use_npy_cache: bool = True
+
+    # arrays loaded by any instance, reused as long as some instance holds them
+    _array_cache: "weakref.WeakValueDictionary[tuple, np.ndarray]" = (
+        weakref.WeakValueDictionary()
+    )
+
     def __init__(
         self,
         target_dir: Optional[str] = None,
@@ -73,6 +153,8 @@ class IdxDataset(Dataset):
         force_download: bool = False,
         load: bool = True,
         verbose: bool = True,
+        packbits: bool = False,
+        use_npy_cache: Optional[bool] = None,
     ) -> None:
         """
         Parameters
@@ -87,12 +169,14 @@ class IdxDataset(Dataset):
             If True, loads data from files in `target_dir`.
         verbose : bool, default=True
             If True, prints download logs.
+        packbits : bool, default=False
+            If True, binarizes images and packs them into bits (see `load`).
+        use_npy_cache : bool, default=`default_use_npy_cache`
+            If True, caches loaded arrays in `.npy` files (see `load`).
         """
 
         self.target_dir = (
-            os.path.join(TEMPORARY_DIR, type(self).__name__)
-            if target_dir is None
-            else target_dir
+            self._default_target_dir() if target_dir is None else target_dir
         )
 
         self._train_images: Optional[np.ndarray] = None
@@ -100,11 +184,15 @@ class IdxDataset(Dataset):
         self._test_images: Optional[np.ndarray] = None
         self._test_labels: Optional[np.ndarray] = None
 
+        self.use_npy_cache = (
+            self.default_use_npy_cache if use_npy_cache is None else use_npy_cache
+        )
+
         if download or force_download:
             self.download(force_download, verbose)
 
         if load:
-            self.load()
+            self.load(packbits=packbits)
 
     def train_images(self) -> np.ndarray:
         """
@@ -154,58 +242,310 @@ class IdxDataset(Dataset):
             self._raise_dataset_not_loaded()
         return self._test_labels
 
+    def train_images_float(self) -> np.ndarray:
+        """
+        Return train_images scaled to [0, 1] as float32 numpy array.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return scale_images(self.train_images())
+
+    def test_images_float(self) -> np.ndarray:
+        """
+        Return test_images scaled to [0, 1] as float32 numpy array.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return scale_images(self.test_images())
+
     def _raise_dataset_not_loaded(self):
         raise RuntimeError(
             "Dataset wasn't loaded. You need to run .load() or create new "
             "object with load=True"
         )
 
-    def load(self, transpose=False) -> None:
+    def load(self, transpose=False, packbits=False) -> None:
         """
         Load data from files in `target_dir`.
 
+        Unless `use_npy_cache` is False, loaded arrays are cached in `.npy`
+        files next to the data files, so subsequent loads only memory-map them.
+        A cache older than its data file is rebuilt.
+
         Parameters
         ----------
         transpose : bool=False
             If True, transposes train and test images.
+        packbits : bool=False
+            If True, binarizes train and test images (pixels > 127 are set)
+            and packs them into bits along the last axis, which takes 8 times
+            less memory. Images can be unpacked with
+            ``np.unpackbits(images, axis=-1, count=width)``.
         """
 
-        for key, (filename, md5) in self.resources.items():
-            filepath = os.path.join(self.target_dir, filename)
-
-            if not check_file_integrity(filepath, md5):
-                raise RuntimeError(
-                    f"Dataset '{key}' not found in '{filepath}' or MD5 "
-                    "checksum is not valid. "
-                    "Use download=True or .download() to download it"
+        # every file is loaded (and transposed) in a separate thread
+        with ThreadPoolExecutor(max_workers=len(self.resources)) as executor:
+            futures = {
+                key: executor.submit(
+                    self._load_file,
+                    key,
+                    filename,
+                    md5,
+                    transpose and key.endswith("_images"),
+                    packbits and key.endswith("_images"),
                 )
+                for key, (filename, md5) in self.resources.items()
+            }
+
+        for key, future in futures.items():
+            setattr(self, f"_{key}", future.result())
 
-            data = read_idx_file(filepath)
-            setattr(self, f"_{key}", data)
+    def _load_file(
+        self, key: str, filename: str, md5: str, transpose: bool, packbits: bool
+    ) -> np.ndarray:
+        filepath = os.path.join(self.target_dir, filename)
 
+        cache_filepath = os.path.splitext(filepath)[0]
         if transpose:
-            self._transpose_images()
+            cache_filepath += "-transposed"
+        if packbits:
+            cache_filepath += "-packed"
+        cache_filepath += ".npy"
 
-    def _transpose_images(self) -> None:
-        self._train_images = np.moveaxis(self._train_images, -2, -1)
-        self._test_images = np.moveaxis(self._test_images, -2, -1)
+        array_key = self._array_key(filepath, transpose, packbits)
+        data = self._array_cache.get(array_key)
+
+        decode = data is None and not (
+            self.use_npy_cache and is_cache_fresh(cache_filepath, filepath)
+        )
+        if decode:
+            # file is verified and decoded from a single read
+            raw = read_verified_file(filepath, md5)
+            is_valid = raw is not None
+        else:
+            is_valid = check_file_integrity(filepath, md5)
+
+        if not is_valid:
+            raise RuntimeError(
+                f"Dataset '{key}' not found in '{filepath}' or MD5 "
+                "checksum is not valid. "
+                "Use download=True or .download() to download it"
+            )
+
+        if data is not None:
+            return data
+
+        if not decode:
+            data = _load_npy_file(cache_filepath)
+        else:
+            data = self._parse_file(raw)
+            if transpose:
+                data = transpose_images(data)
+            if packbits:
+                data = np.packbits(data > 127, axis=-1)
+
+            if self.use_npy_cache:
+                try:
+                    save_npy_file(cache_filepath, data)
+                    data = _load_npy_file(cache_filepath)
+                except OSError:
+                    # e.g. read-only `target_dir`, data is used without cache
+                    pass
+            data.setflags(write=False)
+
+        return self._array_cache.setdefault(array_key, data)
+
+    def _array_key(
+        self, filepath: str, transpose: bool, packbits: bool
+    ) -> Optional[tuple]:
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        return (
+            os.path.abspath(filepath),
+            mtime_ns,
+            transpose,
+            packbits,
+            self.use_npy_cache,
+        )
+
+    def _parse_file(self, raw: bytes) -> np.ndarray:
+        return read_idx_from_bytes(raw)
 
 
 class SplitDataset(Dataset):
+    __slots__ = ("_prefetch_thread", "_prefetch_lock", "_unzipped")
+
     resources = {"gzip": (None, None)}
+    splits: dict[str, type["ZippedDataset"]] = {}
 
-    def _create_split(self, split_cls: type["ZippedDataset"]) -> type["ZippedDataset"]:
-        split_cls.default_base_dir = self.target_dir
+    def __init__(
+        self,
+        target_dir: Optional[str] = None,
+        download: bool = True,
+        force_download: bool = False,
+        verbose: bool = True,
+        prefetch: bool = False,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        target_dir : str, default='/tmp/<dataset_name>/'
+            Directory where all files exist or will be downloaded to (if `download` is True).
+        download : bool, default=True
+            If True and files don't exist in `target_dir`, downloads all files to `target_dir`.
+        force_download : bool, default=False
+            If True, downloads all files to `target_dir`, even if they exist there.
+        verbose : bool, default=True
+            If True, prints download logs.
+        prefetch : bool, default=False
+            If True, unzips files of all splits in a background thread.
+        """
+
+        super().__init__(target_dir, download, force_download, verbose)
+
+        # created by `prefetch`, so datasets which don't prefetch can be pickled
+        self._prefetch_thread: Optional[threading.Thread] = None
+        self._prefetch_lock: Optional[threading.Lock] = None
+        # results of unzipping splits, by their names
+        self._unzipped: Optional[dict[str, Future]] = None
+        if prefetch:
+            self.prefetch()
+
+    def __getattr__(self, name: str) -> "_SplitFactory":
+        # splits are configured lazily, only when they're accessed
+        if name not in self.splits:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+        return _SplitFactory(self, name)
+
+    def __dir__(self) -> list[str]:
+        return [*super().__dir__(), *self.splits]
+
+    def prefetch(self) -> None:
+        """
+        Unzip files of all splits in a background thread.
+
+        Splits created afterwards wait until their files are unzipped, or
+        unzip them right away if the thread hasn't got to them yet. Errors
+        raised while unzipping a split are re-raised when it's created.
+        """
+
+        if self._prefetch_thread is None:
+            self._prefetch_lock = threading.Lock()
+            self._unzipped = {}
+            self._prefetch_thread = threading.Thread(target=self._unzip_splits)
+            self._prefetch_thread.start()
+
+    def _unzip_splits(self) -> None:
+        for name in self.splits:
+            # stop between splits when the interpreter is exiting, so no
+            # partially extracted files are left behind
+            if not threading.main_thread().is_alive():
+                return
+            try:
+                self._unzip_split(name)
+            except Exception:
+                # the split is unzipped again (and fails) when it's created
+                pass
+
+    def _unzip_split(self, name: str) -> None:
+        # every split is unzipped once, by the first thread which needs it;
+        # others wait for it and get its errors
+        while True:
+            with self._prefetch_lock:
+                future = self._unzipped.get(name)
+                claimed = future is None
+                if claimed:
+                    future = self._unzipped[name] = Future()
+
+            if not claimed:
+                if future.result():
+                    return
+                # the unzipping thread was interrupted, so try again
+                continue
+
+            try:
+                self._create_split(self.splits[name])(load=False)
+            except BaseException as error:
+                # a failed split is unzipped again by the next thread
+                with self._prefetch_lock:
+                    del self._unzipped[name]
+                if isinstance(error, Exception):
+                    future.set_exception(error)
+                else:
+                    future.set_result(False)
+                raise
+            future.set_result(True)
+            return
+
+    def _create_split(
+        self, split_cls: type["ZippedDataset"]
+    ) -> Callable[..., "ZippedDataset"]:
         file, md5 = self.resources["gzip"]
-        split_cls.default_zip_filepath = os.path.join(self.target_dir, file)
-        split_cls.zip_md5 = md5
-        return split_cls
+        return functools.partial(
+            split_cls,
+            target_dir=os.path.join(self.target_dir, split_cls.__name__),
+            zip_filepath=os.path.join(self.target_dir, file),
+            zip_md5=md5,
+        )
+
+
+class _SplitFactory:
+    """
+    Constructor of a split of `SplitDataset`, configured with its paths.
+    """
+
+    __slots__ = ("_dataset", "_name")
+
+    def __init__(self, dataset: SplitDataset, name: str) -> None:
+        self._dataset = dataset
+        self._name = name
+
+    def __getattr__(self, name: str) -> Any:
+        # class attributes of the split (e.g. `classes`) are available as before
+        if name.startswith("_"):
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+        return getattr(self._dataset.splits[self._name], name)
+
+    def __call__(self, *args, **kwargs) -> "ZippedDataset":
+        dataset = self._dataset
+        if dataset._prefetch_thread is not None:
+            # waits for the prefetching thread (or unzips the split now) and
+            # re-raises its errors
+            dataset._unzip_split(self._name)
+        return dataset._create_split(dataset.splits[self._name])(*args, **kwargs)
+
+    def is_cached(self) -> bool:
+        """
+        Check if all files of the split are unzipped and have valid checksums.
+
+        Returns
+        -------
+        bool
+            True if the split doesn't need to be unzipped.
+        """
+
+        split_cls = self._dataset.splits[self._name]
+        return split_cls.is_cached(
+            os.path.join(self._dataset.target_dir, split_cls.__name__)
+        )
 
 
 class ZippedDataset(IdxDataset):
+    __slots__ = ("zip_filepath", "zip_md5")
+
     default_base_dir = None
     default_zip_filepath = None
-    zip_md5 = None
+    default_zip_md5 = None
 
     def __init__(
         self,
@@ -215,14 +555,17 @@ class ZippedDataset(IdxDataset):
         force_unzip: bool = False,
         load: bool = True,
         transpose: bool = True,
+        zip_md5: Optional[str] = None,
+        packbits: bool = False,
+        use_npy_cache: Optional[bool] = None,
     ) -> None:
         """
         Parameters
         ----------
-        target_dir : str, default='/tmp/emnist/<split_name>/'
+        target_dir : str, default='<default_base_dir>/<split_name>/'
             Directory where all files exist or will be unzipped to (if `unzip` is True).
-        zip_filepath : str, default='/tmp/emnist/gzip.zip'
-            Filepath to zip file containing all EMNIST split files.
+        zip_filepath : str, default=`default_zip_filepath`
+            Filepath to zip file containing all split files.
         unzip : bool, default=True
             If True and files don't exist in `target_dir`, unzips all files to `target_dir`.
         force_unzip : bool, default=False
@@ -231,28 +574,52 @@ class ZippedDataset(IdxDataset):
             If True, loads data from files in `target_dir`.
         transpose : bool, default=True
             If True, transposes train and test images.
+        zip_md5 : str, optional
+            Correct MD5 checksum of `zip_filepath`.
+        packbits : bool, default=False
+            If True, binarizes images and packs them into bits (see `load`).
+        use_npy_cache : bool, default=`default_use_npy_cache`
+            If True, caches loaded arrays in `.npy` files (see `load`).
         """
 
         self.target_dir = (
-            os.path.join(self.default_base_dir, type(self).__name__)
-            if target_dir is None
-            else target_dir
+            self._default_target_dir() if target_dir is None else target_dir
         )
 
         self.zip_filepath = (
             self.default_zip_filepath if zip_filepath is None else zip_filepath
         )
 
+        if self.zip_filepath is None:
+            raise RuntimeError(
+                f"{type(self).__name__} has no default zip file, "
+                "zip_filepath must be given"
+            )
+
+        self.zip_md5 = self.default_zip_md5 if zip_md5 is None else zip_md5
+
         self._train_images: Optional[np.ndarray] = None
         self._train_labels: Optional[np.ndarray] = None
         self._test_images: Optional[np.ndarray] = None
         self._test_labels: Optional[np.ndarray] = None
 
+        self.use_npy_cache = (
+            self.default_use_npy_cache if use_npy_cache is None else use_npy_cache
+        )
+
         if unzip or force_unzip:
             self.unzip_files(force_unzip)
 
         if load:
-            self.load(transpose)
+            self.load(transpose, packbits)
+
+    @classmethod
+    def _default_target_dir(cls) -> str:
+        if cls.default_base_dir is None:
+            raise RuntimeError(
+                f"{cls.__name__} has no default directory, target_dir must be given"
+            )
+        return os.path.join(cls.default_base_dir, cls.__name__)
 
     def unzip_files(self, force: bool = False) -> None:
         """
@@ -272,30 +639,36 @@ class ZippedDataset(IdxDataset):
                 "Use EMNIST(download=True) or emnist.download() to download it"
             )
 
-        for filename, md5 in self.resources.values():
-            filepath = os.path.join(self.target_dir, filename)
+        # every file is extracted in a separate thread, zlib releases the GIL;
+        # the archive is opened (and its central directory parsed) only once
+        with zipfile.ZipFile(self.zip_filepath, "r") as archive:
+            with ThreadPoolExecutor(max_workers=len(self.resources)) as executor:
+                futures = [
+                    executor.submit(self._unzip_file, archive, filename, md5, force)
+                    for filename, md5 in self.resources.values()
+                ]
+                for future in futures:
+                    future.result()
+
+    def _unzip_file(
+        self, archive: zipfile.ZipFile, filename: str, md5: str, force: bool
+    ) -> None:
+        filepath = os.path.join(self.target_dir, filename)
 
-            if not force and check_file_integrity(filepath, md5):
-                continue
+        if not force and check_file_integrity(filepath, md5):
+            return
 
-            extract_from_zip(self.zip_filepath, filename, self.target_dir)
+        extract_from_zip(archive, filename, self.target_dir)
 
 
 class NpzDataset(IdxDataset):
-    def load(self) -> None:
-        """
-        Load data from files in `target_dir`.
-        """
+    __slots__ = ()
 
-        for key, (filename, md5) in self.resources.items():
-            filepath = os.path.join(self.target_dir, filename)
+    def _parse_file(self, raw: bytes) -> np.ndarray:
+        with np.load(io.BytesIO(raw)) as data:
+            return data["arr_0"]
 
-            if not check_file_integrity(filepath, md5):
-                raise RuntimeError(
-                    f"Dataset '{key}' not found in '{filepath}' or MD5 "
-                    "checksum is not valid. "
-                    "Use download=True or .download() to download it"
-                )
 
-            data = np.load(filepath)["arr_0"]
-            setattr(self, f"_{key}", data)
+def _load_npy_file(filepath: str) -> np.ndarray:
+    # memory-mapped, but exposed as a plain (read-only) ndarray
+    return np.load(filepath, mmap_mode="r").view(np.ndarray)
@@ -1,12 +1,22 @@
-import gzip
+import contextlib
 import hashlib
+import io
+import json
+import math
+import mmap
 import os
+import shutil
 import struct
+import sys
+import threading
 import time
+import weakref
 import zipfile
-from urllib.error import URLError
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import BinaryIO, ContextManager, Iterator, Optional, Union
+from urllib.error import HTTPError, URLError
 from urllib.parse import urljoin
-from urllib.request import urlretrieve
+from urllib.request import Request, urlopen
 
 import numpy as np
 
@@ -14,9 +24,26 @@ _TQDM_ACTIVE = True
 try:
     from tqdm import tqdm
 except ImportError:
-    tqdm = object
     _TQDM_ACTIVE = False
 
+# ISA-L decompresses gzip a few times faster than zlib and has the same API
+try:
+    from isal import isal_zlib as zlib
+except ImportError:
+    import zlib
+
+
+# (absolute path, size, mtime_ns, md5) of files which passed integrity check
+_verified_files: set[tuple[str, int, int, str]] = set()
+
+# members of opened zip archives by their basenames
+_zip_indexes: "weakref.WeakKeyDictionary[zipfile.ZipFile, dict]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# magic number of IDX file: two zero bytes, data type and number of dimensions
+_IDX_HEADER = struct.Struct(">HBB")
+_IDX_DIM_SIZES = {ndims: struct.Struct(">" + "I" * ndims) for ndims in range(1, 5)}
 
 IDX_TYPEMAP = {
     0x08: np.uint8,
@@ -43,14 +70,109 @@ def read_idx_file(filepath: str) -> np.ndarray:
         Data read from IDX file in numpy array.
     """
 
-    fopen = gzip.open if os.path.splitext(filepath)[1] == ".gz" else open
+    with open(filepath, "rb") as f:
+        if os.path.splitext(filepath)[1] == ".gz":
+            return read_idx(GzipReader(f))
 
-    with fopen(filepath, "rb") as f:
-        data = f.read()
+        # uncompressed data is read by numpy straight from the file
+        dtype, dim_sizes = _read_idx_header(f)
+        parsed = np.fromfile(f, dtype=dtype, count=math.prod(dim_sizes))
+        _check_idx_size(dim_sizes, parsed.nbytes + len(f.read()), parsed.itemsize)
+        return _to_native_order(parsed).reshape(dim_sizes)
+
+
+def read_idx_from_bytes(data: bytes) -> np.ndarray:
+    """
+    Read IDX data from bytes and return numpy array.
+
+    Parameters
+    ----------
+    data : bytes
+        Content of a IDX file. The content can be gzipped.
+
+    Returns
+    -------
+    np.ndarray
+        Data read from IDX file in numpy array.
+    """
+
+    # IDX data starts with two zero bytes, so gzip magic number is unambiguous
+    if data[:2] == b"\x1f\x8b":
+        return read_idx(GzipReader(io.BytesIO(data)))
+
+    # uncompressed data isn't copied: the header is unpacked in place and
+    # the array is a read-only view of `data`
+    dtype, dim_struct = _parse_idx_magic(data)
+    dim_sizes = dim_struct.unpack_from(data, _IDX_HEADER.size)
+    offset = _IDX_HEADER.size + dim_struct.size
+    itemsize = np.dtype(dtype).itemsize
+    _check_idx_size(dim_sizes, len(data) - offset, itemsize)
+    parsed = np.frombuffer(data, dtype=dtype, count=math.prod(dim_sizes), offset=offset)
+    return _to_native_order(parsed).reshape(dim_sizes)
+
+
+def read_idx(fileobj: BinaryIO) -> np.ndarray:
+    """
+    Read IDX data from a binary stream and return numpy array.
+
+    The header is parsed first, so the output array can be allocated upfront
+    and the data is read directly into it, without materializing the whole
+    (decompressed) file in memory.
+
+    Parameters
+    ----------
+    fileobj : BinaryIO
+        Binary stream positioned at the beginning of IDX data.
+
+    Returns
+    -------
+    np.ndarray
+        Data read from IDX stream in numpy array.
+    """
+
+    dtype, dim_sizes = _read_idx_header(fileobj)
+
+    parsed = np.empty(math.prod(dim_sizes), dtype=dtype)
+    buffer = memoryview(parsed.view(np.uint8))
 
-    h_len = 4
-    header = data[:h_len]
-    zeros, dtype, ndims = struct.unpack(">HBB", header)
+    n_read = 0
+    while n_read < len(buffer):
+        n = fileobj.readinto(buffer[n_read:])
+        if not n:
+            break
+        n_read += n
+    n_read += len(fileobj.read())
+
+    _check_idx_size(dim_sizes, n_read, parsed.itemsize)
+    return _to_native_order(parsed).reshape(dim_sizes)
+
+
+def _check_idx_size(dim_sizes: tuple[int, ...], n_bytes: int, itemsize: int) -> None:
+    size = math.prod(dim_sizes)
+    if n_bytes != size * itemsize:
+        raise RuntimeError(
+            f"Declared size {dim_sizes}={size} and "
+            f"actual size {n_bytes // itemsize} of data in IDX file "
+            "don't match"
+        )
+
+
+def _to_native_order(parsed: np.ndarray) -> np.ndarray:
+    # IDX data is big-endian, read-only arrays are swapped into a copy
+    if parsed.itemsize > 1 and sys.byteorder == "little":
+        return parsed.byteswap(inplace=parsed.flags.writeable)
+    return parsed
+
+
+def _read_idx_header(fileobj: BinaryIO) -> tuple[type, tuple[int, ...]]:
+    dtype, dim_struct = _parse_idx_magic(fileobj.read(_IDX_HEADER.size))
+    dim_sizes = dim_struct.unpack(fileobj.read(dim_struct.size))
+
+    return dtype, dim_sizes
+
+
+def _parse_idx_magic(header: bytes) -> tuple[type, struct.Struct]:
+    zeros, dtype, ndims = _IDX_HEADER.unpack_from(header)
 
     if zeros != 0:
         raise RuntimeError(
@@ -63,33 +185,197 @@ def read_idx_file(filepath: str) -> np.ndarray:
     except KeyError as e:
         raise RuntimeError(f"Unknown data type 0x{dtype:02X} in IDX file") from e
 
-    dim_offset = h_len
-    dim_len = 4 * ndims
-    dim_sizes = data[dim_offset : dim_offset + dim_len]
-    dim_sizes = struct.unpack(">" + "I" * ndims, dim_sizes)
+    dim_struct = _IDX_DIM_SIZES.get(ndims) or struct.Struct(">" + "I" * ndims)
 
-    data_offset = h_len + dim_len
-    parsed = np.frombuffer(data, dtype=dtype, offset=data_offset)
+    return dtype, dim_struct
 
-    if parsed.shape[0] != np.prod(dim_sizes):
-        raise RuntimeError(
-            f"Declared size {dim_sizes}={np.prod(dim_sizes)} and "
-            f"actual size {parsed.shape[0]} of data in IDX file don't match"
-        )
 
-    return parsed.reshape(dim_sizes)
+class GzipReader(io.RawIOBase):
+    """
+    Readable stream of decompressed gzip data.
+
+    Data is decompressed with zlib (or ISA-L, if `isal` is installed) straight
+    into the buffers passed to `readinto`, skipping the extra buffering layers
+    of `gzip.GzipFile`.
+
+    Parameters
+    ----------
+    fileobj : BinaryIO
+        Binary stream of gzipped data.
+    chunk_size : int, default=1024 * 1024
+        Size of chunks of compressed data read from `fileobj`.
+    """
+
+    def __init__(self, fileobj: BinaryIO, chunk_size: int = 1024 * 1024) -> None:
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._input = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        n_read = 0
+
+        while n_read < len(view):
+            if not self._input:
+                self._input = self._fileobj.read(self._chunk_size)
+                if not self._input:
+                    break
+
+            # the file can consist of multiple gzip members, possibly followed
+            # by zero padding (skipped like in `gzip.GzipFile`)
+            if self._decompressor.eof:
+                self._input = self._input.lstrip(b"\0")
+                if not self._input:
+                    continue
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+            data = self._decompressor.decompress(self._input, len(view) - n_read)
+            self._input = (
+                self._decompressor.unconsumed_tail or self._decompressor.unused_data
+            )
+
+            view[n_read : n_read + len(data)] = data
+            n_read += len(data)
+
+        return n_read
+
+
+@contextlib.contextmanager
+def atomic_open(filepath: str) -> Iterator[BinaryIO]:
+    """
+    Open temporary file for binary writing and move it to `filepath` on success.
+
+    Readers (also in other threads or processes) never see a partially
+    written file under `filepath`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the output file.
+
+    Yields
+    ------
+    BinaryIO
+        Temporary file opened for writing.
+    """
+
+    tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_filepath, "wb") as f:
+            yield f
+        os.replace(tmp_filepath, filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+
+def save_npy_file(filepath: str, data: np.ndarray) -> None:
+    """
+    Save array to `.npy` file atomically.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the output file.
+    data : np.ndarray
+        Array to be saved.
+    """
+
+    with atomic_open(filepath) as f:
+        np.save(f, data)
 
 
-def check_file_integrity(filepath: str, md5: str) -> bool:
+def is_cache_fresh(cache_filepath: str, filepath: str) -> bool:
+    """
+    Check if cache file exists and is not older than the file it was made from.
+
+    Parameters
+    ----------
+    cache_filepath : str
+        Path to the cache file.
+    filepath : str
+        Path to the source file of the cache.
+
+    Returns
+    -------
+    bool
+        True if cache can be used, False if it must be (re)built.
+    """
+
+    try:
+        return os.stat(cache_filepath).st_mtime_ns >= os.stat(filepath).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def transpose_images(images: np.ndarray, block_size: int = 512) -> np.ndarray:
+    """
+    Swap the last two axes of images and return them as a C-contiguous array.
+
+    Images are copied in blocks, so each block fits in CPU cache and the
+    result doesn't force hidden strided copies in downstream code.
+
+    Parameters
+    ----------
+    images : np.ndarray
+        Array of images of shape ``(n_samples, height, width)``.
+    block_size : int, default=512
+        Number of images copied at once.
+
+    Returns
+    -------
+    np.ndarray
+        Transposed images of shape ``(n_samples, width, height)``.
+    """
+
+    n_samples, height, width = images.shape
+    transposed = np.empty((n_samples, width, height), dtype=images.dtype)
+    for i in range(0, n_samples, block_size):
+        transposed[i : i + block_size] = images[i : i + block_size].swapaxes(-2, -1)
+    return transposed
+
+
+def scale_images(images: np.ndarray) -> np.ndarray:
+    """
+    Convert uint8 images to float32 images with values in [0, 1].
+
+    Conversion and scaling are done in a single pass over the data.
+
+    Parameters
+    ----------
+    images : np.ndarray
+        Array of uint8 images.
+
+    Returns
+    -------
+    np.ndarray
+        Array of float32 images.
+    """
+
+    return np.multiply(images, np.float32(1 / 255), dtype=np.float32)
+
+
+def check_file_integrity(filepath: str, md5: str, fast: bool = True) -> bool:
     """
     Check if file exists and if exists if its MD5 checksum is correct.
 
+    Successful checks are remembered (in memory and in `<filepath>.md5cache`
+    file) together with size and modification time of the file, so unchanged
+    files aren't hashed again.
+
     Parameters
     ----------
     filepath : str
         Path to a file.
     md5 : str
         Correct MD5 checksum of the file.
+    fast : bool, default=True
+        If False, always calculates MD5 checksum of the file, ignoring results
+        of previous checks.
 
     Returns
     -------
@@ -97,10 +383,124 @@ def check_file_integrity(filepath: str, md5: str) -> bool:
         Returns True when file exists and its MD5 checksum is equal `md5`.
     """
 
-    return os.path.isfile(filepath) and md5 == calculate_md5(filepath)
+    if not os.path.isfile(filepath):
+        return False
+
+    fingerprint = _file_fingerprint(filepath, md5)
+    if fast and _is_verified(filepath, fingerprint):
+        return True
+
+    return _record_check(filepath, fingerprint, calculate_md5(filepath))
+
+
+def check_files_integrity(
+    items: dict[str, str], max_workers: Optional[int] = None
+) -> dict[str, bool]:
+    """
+    Check integrity of many files in parallel with `check_file_integrity`.
+
+    Parameters
+    ----------
+    items : dict[str, str]
+        Correct MD5 checksums by paths of the files.
+    max_workers : int, optional
+        Maximal number of files checked at the same time. By default all
+        files are checked at once.
+
+    Returns
+    -------
+    dict[str, bool]
+        Results of `check_file_integrity` by paths of the files.
+    """
+
+    if not items:
+        return {}
+
+    # hashlib releases the GIL, so files are hashed on many cores
+    with ThreadPoolExecutor(max_workers=max_workers or len(items)) as executor:
+        futures = {
+            filepath: executor.submit(check_file_integrity, filepath, md5)
+            for filepath, md5 in items.items()
+        }
+    return {filepath: future.result() for filepath, future in futures.items()}
+
+
+def read_verified_file(filepath: str, md5: str) -> Optional[bytes]:
+    """
+    Read the whole file and check its MD5 checksum on the data which was read.
+
+    Files which have to be both verified and decoded are read from disk only
+    once. Results of checks are remembered like in `check_file_integrity`.
 
+    Parameters
+    ----------
+    filepath : str
+        Path to a file.
+    md5 : str
+        Correct MD5 checksum of the file.
 
-def calculate_md5(filepath: str, chunk_size: int = 1024 * 1024) -> str:
+    Returns
+    -------
+    bytes or None
+        Content of the file, or None when file doesn't exist or its MD5
+        checksum isn't equal `md5`.
+    """
+
+    if not os.path.isfile(filepath):
+        return None
+
+    fingerprint = _file_fingerprint(filepath, md5)
+    with open(filepath, "rb") as f:
+        data = f.read()
+
+    if _is_verified(filepath, fingerprint) or _record_check(
+        filepath, fingerprint, hashlib.md5(data).hexdigest()
+    ):
+        return data
+    return None
+
+
+def _file_fingerprint(filepath: str, md5: str) -> dict:
+    stat = os.stat(filepath)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": md5}
+
+
+def _is_verified(filepath: str, fingerprint: dict) -> bool:
+    cache_key = (os.path.abspath(filepath), *fingerprint.values())
+    if cache_key in _verified_files:
+        return True
+
+    try:
+        with open(f"{filepath}.md5cache", "r") as f:
+            if json.load(f) == fingerprint:
+                _verified_files.add(cache_key)
+                return True
+    except (OSError, ValueError):
+        pass
+
+    return False
+
+
+def _record_check(filepath: str, fingerprint: dict, md5: str) -> bool:
+    cache_filepath = f"{filepath}.md5cache"
+
+    if md5 != fingerprint["md5"]:
+        # result of a previous check doesn't describe the file anymore
+        with contextlib.suppress(OSError):
+            os.remove(cache_filepath)
+        return False
+
+    _verified_files.add((os.path.abspath(filepath), *fingerprint.values()))
+    try:
+        with atomic_open(cache_filepath) as f:
+            f.write(json.dumps(fingerprint).encode())
+    except OSError:
+        pass
+
+    return True
+
+
+def calculate_md5(filepath: str, chunk_size: int = 4 * 1024 * 1024) -> str:
     """
     Calculate MD5 checksum of the file.
 
@@ -108,8 +508,9 @@ def calculate_md5(filepath: str, chunk_size: int = 1024 * 1024) -> str:
     ----------
     filepath : str
         Path to a file.
-    chunk_size : int, default=1024 * 1024
-        Size of chunks which will be read from the file.
+    chunk_size : int, default=4 * 1024 * 1024
+        Maximal size of chunks which will be read from the file, if it can't
+        be memory-mapped (and `hashlib.file_digest` isn't available).
 
     Returns
     -------
@@ -117,15 +518,65 @@ def calculate_md5(filepath: str, chunk_size: int = 1024 * 1024) -> str:
         MD5 checksum of the file.
     """
 
-    md5 = hashlib.md5()
+    return calculate_digest(filepath, "md5", chunk_size)
+
+
+def calculate_digest(
+    filepath: str, algorithm: str = "md5", chunk_size: int = 4 * 1024 * 1024
+) -> str:
+    """
+    Calculate hexadecimal digest of the file with any `hashlib` algorithm.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to a file.
+    algorithm : str, default='md5'
+        Name of the hash algorithm accepted by `hashlib.new`, e.g. 'sha256'.
+    chunk_size : int, default=4 * 1024 * 1024
+        Maximal size of chunks which will be read from the file, if it can't
+        be memory-mapped (and `hashlib.file_digest` isn't available).
+
+    Returns
+    -------
+    str
+        Digest of the file.
+    """
+
     with open(filepath, "rb") as fd:
-        while chunk := fd.read(chunk_size):
-            md5.update(chunk)
-    return md5.hexdigest()
+        try:
+            # hash the whole file in one call, without copying it to Python
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # let the kernel read ahead aggressively (not on Windows)
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                return hashlib.new(algorithm, mm).hexdigest()
+        except (OSError, ValueError):
+            # empty files can't be memory-mapped
+            pass
+
+        # Python 3.11+ reads the file in C, into a reused buffer
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fd, algorithm).hexdigest()
+
+        # small files don't need the whole chunk, the buffer is reused
+        size = os.fstat(fd.fileno()).st_size
+        buffer = memoryview(bytearray(min(chunk_size, max(size, mmap.PAGESIZE))))
+
+        digest = hashlib.new(algorithm)
+        while n := fd.readinto(buffer):
+            digest.update(buffer[:n])
+        return digest.hexdigest()
+
+
+def _empty_fn(*args, **kwargs):
+    return
 
 
 class EmptyTqdm(object):
     # https://github.com/tensorflow/datasets/blob/master/tensorflow_datasets/core/utils/tqdm_utils.py#L56
+    __slots__ = ("_iterator",)
+
     def __init__(self, *args, **kwargs):
         self._iterator = args[0] if args else None
 
@@ -133,10 +584,13 @@ class EmptyTqdm(object):
         return iter(self._iterator)
 
     def __getattr__(self, _):
-        def empty_fn(*args, **kwargs):
-            return
+        # the same function is returned for every missing attribute
+        return _empty_fn
 
-        return empty_fn
+    def __setattr__(self, name, value):
+        # attributes set by callers (e.g. `total`) are ignored
+        if name in EmptyTqdm.__slots__:
+            object.__setattr__(self, name, value)
 
     def __enter__(self):
         return self
@@ -145,30 +599,67 @@ class EmptyTqdm(object):
         return
 
 
-class Tqdm(tqdm):
-    # https://github.com/tqdm/tqdm/blob/master/examples/tqdm_wget.py
-    def update_to(self, b=1, bsize=1, tsize=None):
-        if tsize is not None:
-            self.total = tsize
-        return self.update(b * bsize - self.n)
-
-
 def custom_tqdm(*args, verbose, **kwargs):
     if _TQDM_ACTIVE and verbose:
-        return Tqdm(*args, **kwargs)
+        return tqdm(*args, **kwargs)
     else:
         return EmptyTqdm(*args, **kwargs)
 
 
+def download_files(
+    specs: list[tuple[list[str], str, str, Optional[str]]],
+    verbose: bool = False,
+    max_workers: Optional[int] = None,
+) -> None:
+    """
+    Download many files in parallel, each one with `download_file`.
+
+    Parameters
+    ----------
+    specs : list[tuple[list[str], str, str, str or None]]
+        Arguments of `download_file` for every file: mirrors, filename,
+        filepath and MD5 checksum.
+    verbose : bool, default=False
+        If True, prints download logs (every file has its own progress bar).
+    max_workers : int, optional
+        Maximal number of simultaneous downloads. By default all files are
+        downloaded at once.
+    """
+
+    if not specs:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(specs)) as executor:
+        futures = [
+            executor.submit(
+                download_file,
+                mirrors,
+                filename,
+                filepath,
+                verbose,
+                md5,
+                position=position,
+            )
+            for position, (mirrors, filename, filepath, md5) in enumerate(specs)
+        ]
+        for future in futures:
+            future.result()
+
+
 def download_file(
     mirrors: list[str],
     filename: str,
     filepath: str,
     verbose: bool = False,
+    md5: Optional[str] = None,
+    chunk_size: int = 1024 * 1024,
+    position: Optional[int] = None,
 ) -> None:
     """
     Download file trying every mirror if the previous one fails.
 
+    Mirrors are tried in the given order (see `rank_mirrors`).
+
     Parameters
     ----------
     mirrors : list[str]
@@ -179,64 +670,249 @@ def download_file(
         Path to the output file.
     verbose : bool, default=False
         If True, prints download logs.
+    md5 : str, optional
+        Correct MD5 checksum of the file. If given, checksum is calculated
+        while downloading and the next mirror is tried when it doesn't match.
+    chunk_size : int, default=1024 * 1024
+        Size of chunks in which the file is downloaded.
+    position : int, optional
+        Line offset of the progress bar, for downloads running in parallel.
     """
 
+    # data is downloaded to a partial file, so interrupted downloads can be
+    # resumed and `filepath` never contains an incomplete file
+    part_filepath = f"{filepath}.part"
+
     for mirror in mirrors:
         url = urljoin(mirror, filename)
         try:
             if verbose:
                 print(f"Downloading {url} to {filepath}")
+            checksum = _download_part(url, filepath, md5, verbose, chunk_size, position)
+        except URLError as error:
+            if verbose:
+                print(f"Failed to download {url} (trying next mirror):\n{error}")
+            continue
+
+        if md5 is not None and checksum.hexdigest() != md5:
+            os.remove(part_filepath)
+            if verbose:
+                print(f"MD5 checksum of {url} is not valid (trying next mirror)")
+            continue
+
+        os.replace(part_filepath, filepath)
+        return
+
+    raise RuntimeError(f"Error downloading {filename}")
+
+
+def _download_part(
+    url: str,
+    filepath: str,
+    md5: Optional[str],
+    verbose: bool,
+    chunk_size: int,
+    position: Optional[int],
+) -> "hashlib._Hash":
+    part_filepath = f"{filepath}.part"
+
+    # resume from the end of the partial file, if the server supports ranges
+    offset = os.path.getsize(part_filepath) if os.path.isfile(part_filepath) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    try:
+        response = urlopen(Request(url, headers=headers))
+    except HTTPError as error:
+        if not offset or error.code != 416:
+            raise
+        # partial file isn't shorter than the file on the server
+        os.remove(part_filepath)
+        return _download_part(url, filepath, md5, verbose, chunk_size, position)
+
+    checksum = hashlib.md5()
+    resumed = response.status == 206
+    if resumed:
+        with open(part_filepath, "rb") as f:
+            while chunk := f.read(chunk_size):
+                checksum.update(chunk)
+    else:
+        offset = 0
+
+    buffer = memoryview(bytearray(chunk_size))
+    with response, open(part_filepath, "ab" if resumed else "wb") as f:
+        total = response.headers.get("Content-Length")
+        total = int(total) + offset if total is not None else None
+
+        # reserve disk space upfront, so the file isn't fragmented
+        if not resumed and total and hasattr(os, "posix_fallocate"):
+            with contextlib.suppress(OSError):
+                os.posix_fallocate(f.fileno(), 0, total)
+
+        try:
             with custom_tqdm(
                 unit="B",
                 unit_scale=True,
                 unit_divisor=1024,
                 miniters=1,
                 desc=filepath,
+                position=position,
+                initial=offset,
+                total=total,
                 verbose=verbose,
             ) as t:
-                urlretrieve(url, filepath, reporthook=t.update_to)
+                while n := response.readinto(buffer):
+                    f.write(buffer[:n])
+                    checksum.update(buffer[:n])
+                    t.update(n)
                 t.total = t.n
-            return
-        except URLError as error:
-            if verbose:
-                print(f"Failed to download {url} (trying next mirror):\n{error}")
-            continue
+        finally:
+            # reserved space which wasn't filled mustn't be taken for data
+            # when the download is resumed
+            f.truncate()
 
-    raise RuntimeError(f"Error downloading {filename}")
+        if total is not None and f.tell() < total:
+            # partial file is kept, so the download can be resumed
+            raise URLError(f"Connection closed after {f.tell()} of {total} bytes")
+
+    if resumed and md5 is not None and checksum.hexdigest() != md5:
+        # partial file came from a different version of the file, start over
+        os.remove(part_filepath)
+        return _download_part(url, filepath, md5, verbose, chunk_size, position)
+
+    return checksum
 
 
-def extract_from_zip(zip_path: str, filename: str, output_dir: str) -> None:
+def rank_mirrors(
+    mirrors: list[str],
+    filename: str,
+    timeout: float = 5.0,
+    tie_window: float = 0.2,
+) -> list[str]:
+    """
+    Move the first mirror answering a HEAD request to the front of the list.
+
+    Requests are sent to all mirrors in parallel and the function returns as
+    soon as one of them answers. Mirrors answering within `tie_window` seconds
+    of the first one are ties, resolved by the given order of mirrors. Order
+    of the remaining mirrors is preserved.
+
+    Parameters
+    ----------
+    mirrors : list[str]
+        List of the URLs of the mirrors, in the order of preference.
+    filename: str
+        Name of the file on the server.
+    timeout : float, default=5.0
+        Timeout in seconds of a single request.
+    tie_window : float, default=0.2
+        Time in seconds during which more preferred mirrors can still answer
+        after the first one did.
+
+    Returns
+    -------
+    list[str]
+        Mirrors starting from the chosen one.
+    """
+
+    if len(mirrors) < 2:
+        return list(mirrors)
+
+    def is_reachable(mirror: str) -> bool:
+        request = Request(urljoin(mirror, filename), method="HEAD")
+        try:
+            with urlopen(request, timeout=timeout):
+                pass
+        except OSError:
+            return False
+        return True
+
+    # requests to slower mirrors finish (or time out) in the background
+    executor = ThreadPoolExecutor(max_workers=len(mirrors))
+    try:
+        futures = [executor.submit(is_reachable, mirror) for mirror in mirrors]
+
+        first = None
+        pending = set(futures)
+        while pending and first is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            answered = [i for i, f in enumerate(futures) if f in done and f.result()]
+            if answered:
+                first = min(answered)
+
+        if first is None:
+            return list(mirrors)
+
+        # give more preferred mirrors a moment to answer too
+        wait(futures[:first], timeout=tie_window)
+        answered = [
+            i for i in range(first) if futures[i].done() and futures[i].result()
+        ]
+        first = min(answered, default=first)
+    finally:
+        executor.shutdown(wait=False)
+
+    return [mirrors[first], *(m for i, m in enumerate(mirrors) if i != first)]
+
+
+def extract_from_zip(
+    zip_path: Union[str, zipfile.ZipFile], filename: str, output_dir: str
+) -> None:
     """
     Extract file from zip and save it to given directory (with correct metadata).
 
     Parameters
     ----------
-    zip_path : str
-        Path to the zip archive.
+    zip_path : str or zipfile.ZipFile
+        Path to the zip archive or already opened archive. Opened archive can
+        be shared by multiple threads extracting different files.
     filename : str
         Name of the file to be extracted.
     output_dir : str
         Directory where the file will be saved.
     """
 
-    with zipfile.ZipFile(zip_path, "r") as archive:
-        file = list(
-            filter(
-                lambda s: os.path.basename(s.filename) == filename, archive.infolist()
-            )
-        )
-
-        if len(file) != 1:
-            raise RuntimeError(
-                f"Error while extracting {filename}: "
-                f"found {len(file)} corresponding files in {zip_path}"
-            )
-
-        file = file[0]
+    with _open_archive(zip_path) as archive:
+        file = _find_zip_member(archive, filename)
+        filepath = os.path.join(output_dir, os.path.basename(file.filename))
 
-        file.filename = os.path.basename(file.filename)
-        archive.extract(file, output_dir)
+        with archive.open(file) as src, atomic_open(filepath) as dst:
+            shutil.copyfileobj(src, dst, 256 * 1024)
 
         # add correct datetime metadata
         date_time = time.mktime(file.date_time + (0, 0, -1))
-        os.utime(os.path.join(output_dir, file.filename), (date_time, date_time))
+        os.utime(filepath, (date_time, date_time))
+
+
+def _open_archive(
+    zip_path: Union[str, zipfile.ZipFile],
+) -> ContextManager[zipfile.ZipFile]:
+    # an already opened archive is shared, so it's left open
+    if isinstance(zip_path, zipfile.ZipFile):
+        return contextlib.nullcontext(zip_path)
+    return zipfile.ZipFile(zip_path, "r")
+
+
+def _find_zip_member(archive: zipfile.ZipFile, filename: str) -> zipfile.ZipInfo:
+    file = _zip_members_by_basename(archive).get(filename, [])
+
+    if len(file) != 1:
+        raise RuntimeError(
+            f"Error while extracting {filename}: "
+            f"found {len(file)} corresponding files in {archive.filename}"
+        )
+
+    return file[0]
+
+
+def _zip_members_by_basename(
+    archive: zipfile.ZipFile,
+) -> dict[str, list[zipfile.ZipInfo]]:
+    # members are indexed once per archive, not scanned for every extracted file
+    index = _zip_indexes.get(archive)
+    if index is None:
+        index = {}
+        for info in archive.infolist():
+            # zip always separates directories with "/"
+            basename = info.filename.rsplit("/", 1)[-1]
+            index.setdefault(basename, []).append(info)
+        _zip_indexes[archive] = index
+    return index